@@ -3,45 +3,177 @@
 
 import sys
 from collections import deque
+from itertools import pairwise
+
+def _bfs(indptr, indices, src, dst, visited_buf, queue_buf) -> int:
+    for i in range(len(visited_buf)):
+        visited_buf[i] = False
+    visited_buf[src] = True
+    queue_buf[0] = src
+    head = 0
+    tail = 1
+    distance = 0
+
+    while head < tail:
+        level_end = tail
+        while head < level_end:
+            current = queue_buf[head]
+            head += 1
+            if current == dst:
+                return distance
+            for k in range(indptr[current], indptr[current + 1]):
+                neighbor = indices[k]
+                if not visited_buf[neighbor]:
+                    visited_buf[neighbor] = True
+                    queue_buf[tail] = neighbor
+                    tail += 1
+        distance += 1
+
+    return -1
+
+_bfs_kernel = None
+
+def _load_bfs_kernel():
+    # numba is optional and slow to import, so only pull it in once
+    # shortest_path actually needs the kernel; fall back to plain Python
+    global _bfs_kernel
+    if _bfs_kernel is None:
+        try:
+            from numba import njit
+        except ImportError:
+            _bfs_kernel = _bfs
+        else:
+            _bfs_kernel = njit(cache=True)(_bfs)
+    return _bfs_kernel
+
+# below this many stations, importing numpy/scipy costs more than the
+# pure-Python all-pairs BFS it would replace
+CSGRAPH_MIN_STATIONS = 1000
 
 class MetroNetwork:
     def __init__(self):
         self.graph: dict[str, list[str]] = {}
+        self.stations: list[str] = []
+        self.ids: dict[str, int] = {}
+        self.indptr: list[int] | None = None
+        self.indices: list[int] = []
+        self._kernel_args: tuple | None = None
 
     def add_station(self, station: str):
         if station not in self.graph:
+            self.indptr = None
             self.graph[station] = []
 
     def add_connections(self, conns: list[str]):
-        for i in range(len(conns)):
-            if i + 1 == len(conns):
-                break
-
-            self.add_connection(conns[i], conns[i + 1])
+        for station1, station2 in pairwise(conns):
+            self.add_connection(station1, station2)
 
     def add_connection(self, station1: str, station2: str):
+        self.indptr = None
         self.add_station(station1)
         self.add_station(station2)
-        self.graph[station1].append(station2)
-        self.graph[station2].append(station1)
+        if station2 not in self.graph[station1]:
+            self.graph[station1].append(station2)
+            self.graph[station2].append(station1)
+
+    def finalize(self):
+        self.stations = sorted(self.graph)
+        self.ids = {s: i for i, s in enumerate(self.stations)}
+
+        indptr: list[int] = [0]
+        indices: list[int] = []
+        for station in self.stations:
+            indices.extend(self.ids[neighbor] for neighbor in self.graph[station])
+            indptr.append(len(indices))
+
+        self.indptr = indptr
+        self.indices = indices
+        self._kernel_args = None
+
+    def _load_kernel_args(self) -> tuple:
+        n = len(self.stations)
+        kernel = _load_bfs_kernel()
+        if kernel is _bfs:
+            return kernel, self.indptr, self.indices, [False] * n, [0] * n
+
+        import numpy as np
+
+        return (
+            kernel,
+            np.array(self.indptr, dtype=np.int32),
+            np.array(self.indices, dtype=np.int32),
+            np.zeros(n, dtype=np.bool_),
+            np.zeros(n, dtype=np.int32),
+        )
 
     def shortest_path(self, start: str, end: str) -> int | None:
         if start not in self.graph or end not in self.graph:
             return None
 
-        visited: set[str] = set()
-        queue: deque[tuple[str, int]] = deque([(start, 0)])
+        if self.indptr is None:
+            self.finalize()
 
-        while queue:
-            current_station, distance = queue.popleft()
-            if current_station == end:
-                return distance
-            if current_station not in visited:
-                visited.add(current_station)
-                for neighbor in self.graph[current_station]:
-                    if neighbor not in visited:
-                        queue.append((neighbor, distance + 1))
-        return None
+        if self._kernel_args is None:
+            self._kernel_args = self._load_kernel_args()
+
+        kernel, indptr, indices, visited_buf, queue_buf = self._kernel_args
+        distance = kernel(indptr, indices, self.ids[start], self.ids[end], visited_buf, queue_buf)
+        return distance if distance >= 0 else None
+
+    def all_pairs_bfs(self) -> list[list[int]]:
+        if self.indptr is None:
+            self.finalize()
+
+        indptr = self.indptr
+        indices = self.indices
+        n = len(self.stations)
+        dists: list[list[int]] = []
+
+        for start in range(n):
+            distance = [-1] * n
+            distance[start] = 0
+            queue: deque[int] = deque([start])
+
+            while queue:
+                current = queue.popleft()
+                for k in range(indptr[current], indptr[current + 1]):
+                    neighbor = indices[k]
+                    if distance[neighbor] < 0:
+                        distance[neighbor] = distance[current] + 1
+                        queue.append(neighbor)
+
+            dists.append(distance)
+
+        return dists
+
+    def _csgraph_fares(self) -> list[list[int]]:
+        import numpy as np
+        from scipy.sparse import csgraph, csr_matrix
+
+        n = len(self.stations)
+        data = np.ones(len(self.indices), dtype=np.int32)
+        adjacency = csr_matrix((data, self.indices, self.indptr), shape=(n, n))
+        dists = csgraph.shortest_path(adjacency, method="D", directed=False, unweighted=True)
+
+        fares = np.where(np.isfinite(dists) & (dists >= 1), dists + 4, -1).astype(int)
+        np.fill_diagonal(fares, 0)
+        return fares.tolist()
+
+    def fare_matrix(self) -> tuple[list[str], list[list[int]]]:
+        if self.indptr is None:
+            self.finalize()
+
+        if len(self.stations) >= CSGRAPH_MIN_STATIONS:
+            try:
+                return self.stations, self._csgraph_fares()
+            except ImportError:
+                pass
+
+        fares = [
+            [d + 4 if d >= 1 else d for d in row]
+            for row in self.all_pairs_bfs()
+        ]
+        return self.stations, fares
 
     def calculate_fare(self, start: str, end: str) -> int:
         distance = self.shortest_path(start, end)
@@ -100,6 +232,22 @@ STATIONS: dict[str, list[str]] = {
 }
 
 
+def fare_dict(stations: list[str], fares: list[list[int]]) -> dict[str, dict[str, int]]:
+    return {
+        start: {end: fare for end, fare in zip(stations, row) if end != start}
+        for start, row in zip(stations, fares)
+    }
+
+
+def denizen_map(stations: list[str], fares: list[list[int]]) -> str:
+    parts: list[str] = []
+    for start, row in zip(stations, fares):
+        entries = ";".join(f"{end}={fare}" for end, fare in zip(stations, row) if end != start)
+        parts.append(f"{start}=map<[{entries}]>")
+
+    return "map<[" + ";".join(parts) + "]>"
+
+
 def main():
     if len(sys.argv) > 1:
         mode = sys.argv[1]
@@ -110,27 +258,12 @@ def main():
         mode = 'd'
 
     metro = MetroNetwork()
-    allstations_s: set[str] = set()
-    [[allstations_s.add(s) for s in l] for l in STATIONS.values()]
-    allstations = list(allstations_s)
-    allstations.sort()
 
     for line in STATIONS.values():
         metro.add_connections(line)
+    metro.finalize()
 
-    stations = {}
-
-    # Calculate fare from A to E
-    for start_station in allstations:
-        stations[start_station] = {}
-
-        for end_station in allstations:
-            fare = metro.calculate_fare(start_station, end_station)
-
-            if start_station == end_station:
-                continue
-
-            stations[start_station][end_station] = fare
+    names, fares = metro.fare_matrix()
 
     match mode:
         case 'c':
@@ -138,19 +271,12 @@ def main():
             from io import StringIO
 
             buf = StringIO()
-            DataFrame(stations).write_csv(buf)
+            DataFrame(fares, index=names, columns=names).to_csv(buf)
             print(buf.getvalue())
         case 'p':
-            print(stations)
+            print(fare_dict(names, fares))
         case 'd':
-            python_repr = str(stations)
-            python_repr = python_repr.replace("{", "map<[")
-            python_repr = python_repr.replace("}", "]>")
-            python_repr = python_repr.replace("'", "")
-            python_repr = python_repr.replace(", ",";")
-            python_repr = python_repr.replace(": ", "=")
-            print(python_repr)
-        
+            print(denizen_map(names, fares))
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,11 @@
 # Copyright (c) Eason Qin, 2024
 # This source code form is licensed under the MIT license
 
+from collections import deque
 from enum import Enum
 from dataclasses import dataclass
-from collections import deque
+from itertools import pairwise
+from functools import lru_cache
 
 import colorama
 import sys
@@ -15,96 +17,110 @@ class Line(Enum):
     HTL = "Hattakesh Line"
     RLR = "Redackistan Light Rail"
 
-@dataclass
 class Action:
-    def __init__(self) -> None:
-        pass   
+    __slots__ = ()
 
-@dataclass
+@dataclass(slots=True)
 class Transfer(Action):
     at: str
     from_line: Line
     to_line: Line
 
-@dataclass
+@dataclass(slots=True)
 class GoTo(Action):
     to: str
     frm: str 
     on_line: Line
     stations: list[str]
+    to_line: Line | None = None
 
-@dataclass
+@dataclass(slots=True)
 class BeginAt(Action):
     station: str
 
-@dataclass
+@dataclass(slots=True)
 class ArriveAt(Action):
     station: str
 
-@dataclass
 class MetroNetwork:
     def __init__(self):
         self.graph: dict[str, list[str]] = {}
+        self._path_cache: dict[tuple[str, str], list[str] | None] = {}
+        self._name2id: dict[str, int] = {}
+        self._id2name: list[str] = []
+        self._adj_ids: list[list[int]] | None = None
 
     def add_station(self, station: str):
         if station not in self.graph:
+            self._path_cache.clear()
+            self._adj_ids = None
             self.graph[station] = []
 
     def add_connections(self, conns: list[str]):
-        for i in range(len(conns)):
-            if i + 1 == len(conns):
-                break
-
-            self.add_connection(conns[i], conns[i + 1])
+        for station1, station2 in pairwise(conns):
+            self.add_connection(station1, station2)
 
     def add_connection(self, station1: str, station2: str):
+        self._path_cache.clear()
+        self._adj_ids = None
         self.add_station(station1)
         self.add_station(station2)
-        self.graph[station1].append(station2)
-        self.graph[station2].append(station1)
+        if station2 not in self.graph[station1]:
+            self.graph[station1].append(station2)
+            self.graph[station2].append(station1)
 
     def get_path(self, start: str, end: str) -> list[str] | None:
-        if start not in self.graph or end not in self.graph:
-            return None
-
-        visited: set[str] = set()
-        queue: deque[tuple[str, list[str]]] = deque([(start, [start])])
+        key = (start, end)
+        if key not in self._path_cache:
+            self._path_cache[key] = self._bfs(start, end)
 
-        while queue:
-            current_station, path = queue.popleft()
-            if current_station == end:
-                return path
-            if current_station not in visited:
-                visited.add(current_station)
-                for neighbor in self.graph[current_station]:
-                    if neighbor not in visited:
-                        queue.append((neighbor, path + [neighbor]))
+        path = self._path_cache[key]
+        return list(path) if path is not None else None
 
-        return None
+    def _build_ids(self):
+        self._id2name = list(self.graph)
+        self._name2id = {s: i for i, s in enumerate(self._id2name)}
+        self._adj_ids = [[self._name2id[n] for n in self.graph[s]] for s in self._id2name]
 
-
-    def shortest_path(self, start: str, end: str) -> int | None:
+    def _bfs(self, start: str, end: str) -> list[str] | None:
         if start not in self.graph or end not in self.graph:
             return None
 
-        visited: set[str] = set()
-        queue: deque[tuple[str, int]] = deque([(start, 0)])
+        if self._adj_ids is None:
+            self._build_ids()
+
+        adj_ids: list[list[int]] = self._adj_ids # type: ignore
+        src = self._name2id[start]
+        dst = self._name2id[end]
+
+        parents = [-1] * len(self._id2name)
+        parents[src] = src
+        queue: deque[int] = deque([src])
 
         while queue:
-            current_station, distance = queue.popleft()
-            if current_station == end:
-                return distance
-            if current_station not in visited:
-                visited.add(current_station)
-                for neighbor in self.graph[current_station]:
-                    if neighbor not in visited:
-                        queue.append((neighbor, distance + 1))
+            v = queue.popleft()
+            if v == dst:
+                ids: list[int] = [v]
+                while v != src:
+                    v = parents[v]
+                    ids.append(v)
+                return [self._id2name[v] for v in reversed(ids)]
+            for n in adj_ids[v]:
+                if parents[n] < 0:
+                    parents[n] = v
+                    queue.append(n)
+
         return None
 
+    def shortest_path(self, start: str, end: str) -> int | None:
+        path = self.get_path(start, end)
+        return len(path) - 1 if path is not None else None
+
     def calculate_fare(self, start: str, end: str) -> int:
-        distance = self.shortest_path(start, end)
-        if distance is None:
+        path = self.get_path(start, end)
+        if path is None:
             raise ValueError("invalid route")
+        distance = len(path) - 1
         base_fare = 5
         additional_cost = 1 * (distance - 1)
         total_fare = base_fare + additional_cost
@@ -236,28 +252,35 @@ STATION_CODES: dict[str, list[str]] = {
     "amiri south": ["RL3"],
 }
 
-def has_common(list1: list, list2: list) -> bool:
-    set1 = set(list1)
-    set2 = set(list2)
-    return not set1.isdisjoint(set2)
+LINE_BIT: dict[Line, int] = {
+    Line.CTL: 1,
+    Line.CSL: 2,
+    Line.APL: 4,
+    Line.HTL: 8,
+    Line.RLR: 16,
+}
 
-def common_line_between_stations(stations: list[str]) -> list[Line]:
-    lines: list[set[Line]] = []
+STATION_LINE_MASK: dict[str, int] = {
+    station: sum(LINE_BIT[line] for line in lines) for station, lines in STATION_LINES.items()
+}
 
+@lru_cache(maxsize=None)
+def common_line_between_stations(stations: tuple[str, ...]) -> tuple[Line, ...]:
     if len(stations) == 0:
         raise ValueError("Not enough stations for calculaton")
-     
-    for station in stations:
-        lines.append(set(STATION_LINES[station]))
-    
-    val: set[Line] = set(lines[0]).intersection(*lines[1:])
-    return list(val)
+
+    mask = STATION_LINE_MASK[stations[0]]
+    for station in stations[1:]:
+        mask &= STATION_LINE_MASK[station]
+
+    return tuple(line for line, bit in LINE_BIT.items() if mask & bit)
 
 def get_route_from_path(path: list[str]) -> list[Action]:
     route: list[Action] = []
     begin = ""
     buf = []
     i = 0
+    path_masks = [STATION_LINE_MASK[station] for station in path]
 
     while i < len(path):
         if i == 0:
@@ -266,7 +289,7 @@ def get_route_from_path(path: list[str]) -> list[Action]:
             curline = STATION_LINES[path[i]][0]
 
         try:
-            cond = lambda: has_common(STATION_LINES[path[i]], STATION_LINES[path[i+1]]) and curline in set(STATION_LINES[path[i]]) | set(STATION_LINES[path[i+1]])
+            cond = lambda: path_masks[i] & path_masks[i+1] != 0 and LINE_BIT[curline] & (path_masks[i] | path_masks[i+1]) != 0
             while cond():
                 buf.append(path[i])
                 i += 1
@@ -275,7 +298,7 @@ def get_route_from_path(path: list[str]) -> list[Action]:
             if i == len(path) - 1:
                 #i -= 1
                 if not isinstance(route[len(route)-1], GoTo):
-                    common_lines = common_line_between_stations(buf)
+                    common_lines = common_line_between_stations(tuple(buf))
                     common_line = common_lines[0] # FIXME: later
                     buf.append(path[i])
 
@@ -288,19 +311,21 @@ def get_route_from_path(path: list[str]) -> list[Action]:
                     route.append(ArriveAt(path[i]))
                     break
 
-        if len(STATION_LINES[path[i]]) > 1:
-            curline = STATION_LINES[path[i]][0]
-            route.append(GoTo(path[i], begin, curline, buf))
+        cur = path[i]
+        cur_lines = STATION_LINES[cur]
+        if len(cur_lines) > 1:
+            curline = cur_lines[0]
+            route.append(GoTo(cur, begin, curline, buf))
             nextstation = path[i+1]
-            buf = [path[i], nextstation]
-            route.append(Transfer(path[i], STATION_LINES[nextstation][0], STATION_LINES[path[i]][0]))
-            begin = path[i]
+            buf = [cur, nextstation]
+            route.append(Transfer(cur, STATION_LINES[nextstation][0], curline))
+            begin = cur
             i+=1
 
     for i, actn in enumerate(route):
         if isinstance(actn, GoTo):
             buf = actn.stations
-            line = common_line_between_stations(buf)[0]
+            line = common_line_between_stations(tuple(buf))[0]
             actn.on_line = line
 
             if isinstance(route[i+1], Transfer):
@@ -315,20 +340,18 @@ def get_route_from_path(path: list[str]) -> list[Action]:
 
     return route
 
+_B = colorama.Style.BRIGHT
+_R = colorama.Style.RESET_ALL
+_COLORS: dict[Line, str] = {
+    Line.CTL: colorama.Fore.GREEN,
+    Line.CSL: colorama.Fore.RED,
+    Line.APL: colorama.Fore.BLUE,
+    Line.HTL: colorama.Fore.MAGENTA,
+    Line.RLR: colorama.Fore.CYAN,
+}
+
 def line_to_color(line: Line) -> str:
-    match line:
-        case Line.CTL:
-            return colorama.Fore.GREEN
-        case Line.CSL:
-            return colorama.Fore.RED
-        case Line.APL:
-            return colorama.Fore.BLUE
-        case Line.HTL:
-            return colorama.Fore.MAGENTA
-        case Line.RLR:
-            return colorama.Fore.CYAN
-        case _:
-            return ""
+    return _COLORS.get(line, "")
 
 def station_code_to_line(code: str) -> Line:
     match code[:2]:
@@ -346,22 +369,26 @@ def station_code_to_line(code: str) -> Line:
             raise ValueError()
 
 def display_line(line: Line):
-    return f"{colorama.Style.BRIGHT}{line_to_color(line)}{line.value}{colorama.Style.RESET_ALL}"
+    return f"{_B}{line_to_color(line)}{line.value}{_R}"
 
 def display_station_code(station_code: list[str]):
     res = "("
     for i, code in enumerate(station_code):
         line = station_code_to_line(code)
         color = line_to_color(line)
-        txt = f"{colorama.Style.BRIGHT}{color}{code}{colorama.Style.RESET_ALL}" 
+        txt = f"{_B}{color}{code}{_R}"
         
         if i < len(station_code) - 1:
             txt += '|'
         res += txt
     return res + ")"
 
+_STATION_DISPLAY: dict[str, str] = {
+    station: f"{display_station_code(codes)} {_B}{station.title()}{_R}" for station, codes in STATION_CODES.items()
+}
+
 def display_station(station: str):
-    return f"{display_station_code(STATION_CODES[station])} {colorama.Style.BRIGHT}{station.title()}{colorama.Style.RESET_ALL}"
+    return _STATION_DISPLAY[station]
 
 def display_station_list(stations: list[str]):
     txt = ""
@@ -380,30 +407,27 @@ def display_station_list(stations: list[str]):
 
 
 def display_route(route: list[Action]) -> str:
-    txt = ""
+    parts: list[str] = []
 
     for action in route:
         if isinstance(action, BeginAt):
-            txt += f"{colorama.Style.BRIGHT}Begin{colorama.Style.RESET_ALL} at {display_station(action.station)}"
+            parts.append(f"{_B}Begin{_R} at {display_station(action.station)}")
         elif isinstance(action, GoTo):
-            txt += f"{colorama.Style.BRIGHT}Go to{colorama.Style.RESET_ALL} {display_station(action.to)} from {display_station(action.frm)} on the {display_line(action.on_line)} ({len(action.stations)-1} stops)"# via {display_station_list(action.stations)}"
+            parts.append(f"{_B}Go to{_R} {display_station(action.to)} from {display_station(action.frm)} on the {display_line(action.on_line)} ({len(action.stations)-1} stops)")# via {display_station_list(action.stations)}"
         elif isinstance(action, Transfer):
-            txt += f"{colorama.Style.BRIGHT}Transfer from{colorama.Style.RESET_ALL} {display_station(action.at)} from the {display_line(action.from_line)} to the {display_line(action.to_line)}"
+            parts.append(f"{_B}Transfer from{_R} {display_station(action.at)} from the {display_line(action.from_line)} to the {display_line(action.to_line)}")
         elif isinstance(action, ArriveAt):
-            txt += f"{colorama.Style.BRIGHT}Arrive at{colorama.Style.RESET_ALL} {display_station(action.station)}"
-        
-        txt += "\n"
+            parts.append(f"{_B}Arrive at{_R} {display_station(action.station)}")
+        else:
+            parts.append("")
 
-    return txt
+    return "\n".join(parts) + "\n"
 
 def main():
     colorama.init()
 
     metro = MetroNetwork()
-    allstations_s: set[str] = set()
-    [[allstations_s.add(s) for s in l] for l in STATIONS.values()]
-    allstations = list(allstations_s)
-    allstations.sort()
+    allstations_s: set[str] = set().union(*STATIONS.values())
 
     for line in STATIONS.values():
         metro.add_connections(line)
@@ -425,7 +449,7 @@ def main():
 
     route = get_route_from_path(path)
     pretty_route = display_route(route)
-    cost = metro.calculate_fare(frm, to)
+    cost = 5 + (len(path) - 2) if len(path) > 1 else -1
 
     print("\n" + pretty_route) 
     print(f"\nIt will cost {colorama.Style.BRIGHT}{cost} Siyyats.{colorama.Style.RESET_ALL}")